@@ -1,22 +1,43 @@
 #!/usr/bin/python3
 from argparse import ArgumentParser
+import asyncio
 import collections
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+from functools import partial
 import json
 from launchpadlib.launchpad import Launchpad
 import logging
 import os
+import shelve
 from string import Template
 import sys
+import threading
 import yaml
 from yaml.representer import Representer
 
+try:
+    from yaml import CSafeDumper as Dumper
+except ImportError:
+    from yaml import SafeDumper as Dumper
 
-UTCNOW = datetime.datetime.now()
+
+UTCNOW = datetime.datetime.now(datetime.timezone.utc)
 CACHEDIR = os.path.expanduser("~/.launchpadlib/cache")
+CREDENTIALS = os.path.join(CACHEDIR, "creds")
+MP_CACHE = os.path.join(CACHEDIR, "mps.db")
+MAX_WORKERS = 8
+HTTP_TIMEOUT = 30
+
+MergeProposal = collections.namedtuple(
+    "MergeProposal", ["web_link", "self_link", "date_created"]
+)
 
-yaml.add_representer(collections.defaultdict, Representer.represent_dict)
+Dumper.add_representer(collections.defaultdict, Representer.represent_dict)
+
+_thread_state = threading.local()
+_mp_cache_lock = threading.Lock()
 
 
 class Project(object):
@@ -31,40 +52,72 @@ class Project(object):
             "Rejected",
             "Merged",
         ]
-        self.merge_proposals = self._render_merge_proposals()
+        self.merge_proposals = []
+        self._votes_by_reviewer = {}
+
+    async def load(self, pool):
+        """Fetch the project's merge proposals and their votes using the
+        shared pool.
+        """
+        self.merge_proposals = await self._render_merge_proposals(pool)
+        self._votes_by_reviewer = await self._render_votes(pool)
 
     @property
     def name(self):
         return self.project.name
 
-    def _render_merge_proposals(self) -> list:
+    async def _render_merge_proposals(self, pool) -> list:
         """Fetch all merge proposals for the project and filter by the 
-        specified window.
-        :returns: list of launchpad.branch_merge_proposal objects
+        specified window. Each status is fetched concurrently.
+        :returns: list of MergeProposal
         """
         project_mps = []
         logging.debug(
             f"Fetching votes for {self.project.name} merge proposals. "
             "This may take a while."
         )
-        for status in self.review_status:
-            mps = self.project.getMergeProposals(status=status)
-            for mp in mps:
-                if in_window(self.window, mp.date_created):
-                    project_mps.append(mp)
+        loop = asyncio.get_running_loop()
+        tasks = [
+            loop.run_in_executor(
+                pool,
+                partial(
+                    cached_merge_proposals,
+                    self.project.self_link,
+                    status,
+                    self.window,
+                ),
+            )
+            for status in self.review_status
+        ]
+        for mps in await asyncio.gather(*tasks):
+            project_mps.extend(mps)
         return project_mps
 
+    async def _render_votes(self, pool) -> dict:
+        """Fetch the votes on every merge proposal, grouped by reviewer, so
+        each vote list is fetched once however many users are reported on.
+        The vote list of every merge proposal is fetched concurrently.
+        :returns: dict of { reviewer link: { mp link: vote } }
+        """
+        votes = defaultdict(dict)
+        loop = asyncio.get_running_loop()
+        vote_lists = await asyncio.gather(
+            *[
+                loop.run_in_executor(pool, fetch_votes, mp.self_link)
+                for mp in self.merge_proposals
+            ]
+        )
+        for mp, mp_votes in zip(self.merge_proposals, vote_lists):
+            for reviewer_link, vote in mp_votes:
+                votes[reviewer_link][mp.web_link] = vote
+        return dict(votes)
+
     def render_project_votes_by_user(self, user) -> dict:
         """Render all votes on a given project for a given user.
         :param user: launchpad.person object
         :returns: dict of { mp link: vote }
         """
-        votes = {}
-        for mp in self.merge_proposals:
-            for vote in [v for v in mp.votes if v.comment]:
-                if vote.reviewer.display_name == user.display_name:
-                    votes[mp.web_link] = vote.comment.vote
-        return votes
+        return self._votes_by_reviewer.get(user.self_link, {})
 
 
 class Report(object):
@@ -88,54 +141,83 @@ class Report(object):
             "Fix Released",
         ]
 
-    def _render_reported(self) -> dict:
-        """Fetch and render bugs reported by the user.
-        :returns: dict of { project: { bug info } } 
+    def _search_reported(self) -> list:
+        """Search for bug tasks reported by the user. Runs in a worker
+        thread.
+        :returns: list of ( project, bug link, title )
+        """
+        user = thread_load(self.user.self_link)
+        tasks = user.searchTasks(
+            bug_reporter=user, status=self.status, created_since=self.since
+        )
+        return [(t.bug_target_name, t.bug_link, t.title) for t in tasks]
+
+    async def _render_reported(self, pool) -> dict:
+        """Fetch and render bugs reported by the user. The bugs behind
+        the matching tasks are fetched concurrently.
+        :returns: dict of { project: { bug id: title } }
         """
         logging.debug(f"Fetching reported bugs for {self.user.display_name}")
-        reported = defaultdict(list)
-        tasks = self.user.searchTasks(
-            bug_reporter=self.user, status=self.status, created_since=self.since
+        reported = defaultdict(dict)
+        loop = asyncio.get_running_loop()
+        tasks = await loop.run_in_executor(pool, self._search_reported)
+        bug_links = list({bug_link for _, bug_link, _ in tasks})
+        bugs = await asyncio.gather(
+            *[loop.run_in_executor(pool, fetch_bug, link) for link in bug_links]
         )
-        tasks = [LPWrap(t) for t in tasks]
-        for t in tasks:
-            if in_window(self.window, t.bug.date_created):
-                reported[t.bug_target_name].append(
-                    {t.bug.id: t.title,}
-                )
+        bugs = dict(zip(bug_links, bugs))
+        for target, bug_link, title in tasks:
+            bug_id, date_created = bugs[bug_link]
+            if in_window(self.since, date_created):
+                reported[target][bug_id] = title
         return reported
 
-    def _render_merge_proposals(self) -> defaultdict:
+    async def _render_merge_proposals(self, pool) -> defaultdict:
         """Renders merge proposals submitted by a given user.
         :returns: dict of { project: [ mp links ] }
         """
         logging.debug(f"Fetching merge proposals for {self.user.display_name}")
         proposals = defaultdict(list)
-        for status in [
-            "Work in progress",
-            "Needs review",
-            "Approved",
-            "Rejected",
-            "Merged",
-            "Code failed to merge",
-            "Queued",
-            "Superseded",
-        ]:
-            all_mps = self.user.getMergeProposals(status=status)
+        loop = asyncio.get_running_loop()
+        tasks = [
+            loop.run_in_executor(
+                pool,
+                partial(
+                    fetch_merge_proposals,
+                    self.user.self_link,
+                    status,
+                    self.since,
+                    newest_first=True,
+                ),
+            )
+            for status in [
+                "Work in progress",
+                "Needs review",
+                "Approved",
+                "Rejected",
+                "Merged",
+                "Code failed to merge",
+                "Queued",
+                "Superseded",
+            ]
+        ]
+        for all_mps in await asyncio.gather(*tasks):
             for mp in all_mps:
-                if not in_window(self.window, mp.date_created):
-                    break
                 project = mp.web_link.split("/")[4]
                 proposals[project].append(mp.web_link)
         return proposals
 
-    def generate(self) -> dict:
+    async def generate(self, pool) -> dict:
         """Build the full report of a user.
         :returns: dict of data on a given user
         """
+        merge_proposals, bug_reports = await asyncio.gather(
+            self._render_merge_proposals(pool),
+            self._render_reported(pool),
+        )
         user_data = {
-            "merge_proposals": self._render_merge_proposals(),
-            "bug_reports": self._render_reported(),
+            "merge_proposals": merge_proposals,
+            "bug_reports": bug_reports,
             "code_reviews": {},
         }
         for project in self.projects:
@@ -146,47 +228,145 @@ class Report(object):
         return user_data
 
 
-class LPWrap:
-    """Simple wrapper Cache-Proxy for LP objects"""
+def login():
+    """Log in to Launchpad, reusing the OAuth credentials stored in
+    CREDENTIALS so that no worker has to authorize again. Each session
+    holds one httplib2 connection, which is kept alive and reused for
+    every request made through it.
+    """
+    return Launchpad.login_with(
+        "contrib-tracker",
+        "production",
+        CACHEDIR,
+        timeout=HTTP_TIMEOUT,
+        credentials_file=CREDENTIALS,
+        version="devel",
+    )
+
+
+def thread_launchpad():
+    """Return the Launchpad session owned by the calling thread.
+    launchpadlib's httplib2 connection isn't thread-safe, so every worker
+    logs in on its own; the credentials and the HTTP cache are shared.
+    """
+    if not hasattr(_thread_state, "launchpad"):
+        thread = threading.current_thread().name
+        logging.debug(f"Opening Launchpad session for {thread}")
+        _thread_state.launchpad = login()
+        _thread_state.entries = {}
+    return _thread_state.launchpad
+
+
+def with_thread_launchpad(factory, *args):
+    """Call factory with the calling thread's Launchpad session followed by
+    args. Used to build Project and Report objects inside a worker.
+    """
+    return factory(thread_launchpad(), *args)
 
-    def __init__(self, lpObj):
-        self.lpObj = lpObj
 
-    def __getattr__(self, attr):
-        result = getattr(self.lpObj, attr)
-        # Tricky. We look at the attr, and if it is another launchpadlib
-        # object, then we wrap *it* too. e.g., you asked for task.bug, where
-        # bug is a launchpadlib object contained within the task lplib object.
-        # Eventually, we'll just get a normal attribute that isn't an lplib
-        # object, which we cache with setattr and then later retrieve with
-        # the above getattr.
-        if result.__class__.__name__ == "Entry":
-            result = LPWrap(result)
-        setattr(self, attr, result)
-        return result
+def thread_load(link):
+    """Load a launchpad object through the calling thread's session,
+    reusing it if this thread has loaded it before.
+    """
+    launchpad = thread_launchpad()
+    if link not in _thread_state.entries:
+        _thread_state.entries[link] = launchpad.load(link)
+    return _thread_state.entries[link]
+
+
+def fetch_merge_proposals(owner_link, status, cutoff, newest_first=False):
+    """Fetch the merge proposals of a given status created since the
+    cutoff. Runs in a worker thread, so the collection is paged in here
+    rather than lazily. Launchpad has no date filter for this query; when
+    the caller knows the results come newest first we stop paging at the
+    first proposal outside the window, otherwise every one is checked.
+    :param owner_link: link to a launchpad project or person
+    :returns: list of MergeProposal
+    """
+    owner = thread_load(owner_link)
+    mps = []
+    for mp in owner.getMergeProposals(status=status):
+        if not in_window(cutoff, mp.date_created):
+            if newest_first:
+                break
+            continue
+        # wadllib's tzinfo can't be unpickled, so normalize to stdlib UTC
+        # before the proposal can reach the disk cache.
+        date_created = mp.date_created.astimezone(datetime.timezone.utc)
+        mps.append(MergeProposal(mp.web_link, mp.self_link, date_created))
+    return mps
+
+
+def cached_merge_proposals(owner_link, status, window):
+    """Same as fetch_merge_proposals, but results are kept on disk and
+    reused for half the window, so repeat runs skip the fetch entirely.
+    :returns: list of MergeProposal
+    """
+    key = f"{owner_link}:{status}:{window}"
+    cutoff = UTCNOW - datetime.timedelta(window)
+    with _mp_cache_lock, shelve.open(MP_CACHE) as cache:
+        try:
+            cached = cache.get(key)
+        except Exception:
+            logging.debug(f"Discarding unreadable cache entry {key}")
+            cached = None
+    if cached is not None:
+        fetched, mps = cached
+        if UTCNOW - fetched < datetime.timedelta(window / 2):
+            return [mp for mp in mps if in_window(cutoff, mp.date_created)]
+
+    mps = fetch_merge_proposals(owner_link, status, cutoff)
+    with _mp_cache_lock, shelve.open(MP_CACHE) as cache:
+        cache[key] = (UTCNOW, mps)
+    return mps
+
+
+def fetch_bug(bug_link):
+    """Fetch a bug. Runs in a worker thread.
+    :returns: ( bug id, date created )
+    """
+    bug = thread_launchpad().load(bug_link)
+    return bug.id, bug.date_created
+
 
+def fetch_votes(mp_link):
+    """Fetch the votes cast on a merge proposal. Runs in a worker thread,
+    so comments are dereferenced here as well. Reviewers are identified by
+    link, which needs no extra request.
+    :param mp_link: link to a launchpad.branch_merge_proposal
+    :returns: list of ( reviewer link, vote )
+    """
+    votes = thread_load(mp_link).votes
+    return [
+        (vote.reviewer_link, vote.comment.vote)
+        for vote in votes
+        if vote.comment_link is not None
+    ]
 
-def in_window(window, date):
+
+def in_window(cutoff, date):
     """Check if the requested date is within a window of time
+    :param cutoff: timezone-aware start of the window
     :returns: True if date is within window
     """
-    win = datetime.timedelta(window)
-    if date == None:
-        return False
-    date = date.replace(tzinfo=None)
-    delta = UTCNOW - date
-    return delta <= win
+    return date is not None and date >= cutoff
+
+
+def output_yaml(report, stream):
+    """Writes report data to a stream as YAML."""
+    yaml.dump(report, stream, Dumper=Dumper, default_flow_style=False)
 
 
-def output_data(report, format="yaml"):
-    """Outputs report data in the specified format."""
-    format = format.lower()
-    if format == "yaml":
-        return yaml.dump(report, default_flow_style=False)
-    elif format == "json":
-        return json.dumps(report)
-    else:
-        raise NotImplementedError
+def output_json(report, stream):
+    """Writes report data to a stream as JSON."""
+    json.dump(report, stream)
+    stream.write("\n")
+
+
+_FORMATTERS = {
+    "yaml": output_yaml,
+    "json": output_json,
+}
 
 
 def parse_args(args):
@@ -218,8 +398,9 @@ def parse_args(args):
         "--format",
         "-f",
         default="yaml",
-        choices=["YAML", "yaml", "JSON", "json"],
-        help="Output format. Choose from YAML(default), JSON, CSV",
+        type=str.lower,
+        choices=sorted(_FORMATTERS),
+        help="Output format. Choose from YAML(default), JSON",
     )
     parser.add_argument(
         "--quiet", "-q", action="store_true", help="Quiet mode, skips printing."
@@ -230,28 +411,57 @@ def parse_args(args):
     return parser.parse_args(args)
 
 
-def main(args):
-    opts = parse_args(args)
-    logging.basicConfig(format="%(asctime)s - %(message)s", level=opts.debug)
-    launchpad = Launchpad.login_with(
-        "contrib-tracker", "production", CACHEDIR, version="devel"
+async def create_project(pool, name: str, window: int) -> Project:
+    """Build a Project in a worker thread and fetch its merge proposals."""
+    loop = asyncio.get_running_loop()
+    project = await loop.run_in_executor(
+        pool, partial(with_thread_launchpad, Project, name, window)
+    )
+    await project.load(pool)
+    return project
+
+
+async def create_report(pool, user: str, projects: list, window: int) -> dict:
+    """Build a Report in a worker thread and generate it."""
+    loop = asyncio.get_running_loop()
+    report = await loop.run_in_executor(
+        pool, partial(with_thread_launchpad, Report, user, projects, window)
     )
+    return await report.generate(pool)
 
-    projects = []
-    for project in opts.projects.split(","):
-        projects.append(Project(launchpad, project, opts.window))
 
-    reports = {}
-    for user in opts.users.split(","):
-        report = Report(launchpad, user, projects, opts.window)
-        reports[user] = report.generate()
+async def main_async(args):
+    opts = parse_args(args)
+    logging.basicConfig(format="%(asctime)s - %(message)s", level=opts.debug)
+    # Log in once up front so any interactive authorization happens before
+    # the workers start and they all find cached credentials.
+    os.makedirs(CACHEDIR, exist_ok=True)
+    login()
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        projects = await asyncio.gather(
+            *[
+                create_project(pool, project, opts.window)
+                for project in opts.projects.split(",")
+            ]
+        )
+        users = opts.users.split(",")
+        user_reports = await asyncio.gather(
+            *[create_report(pool, user, projects, opts.window) for user in users]
+        )
+    reports = dict(zip(users, user_reports))
 
+    output = _FORMATTERS[opts.format]
     if not opts.quiet:
-        print(output_data(reports, format=opts.format))
+        output(reports, sys.stdout)
 
     if opts.out:
         with open(opts.out, "w+") as f:
-            f.write(output_data(reports, format=opts.format))
+            output(reports, f)
+
+
+def main(args):
+    asyncio.run(main_async(args))
 
 
 if __name__ == "__main__":